@@ -4,6 +4,8 @@ Hebrew Health Insurance RAG System
 Main orchestration file for the RAG pipeline.
 """
 
+import asyncio
+import hashlib
 import os
 import sys
 from typing import List
@@ -13,6 +15,27 @@ from src.utils import DocumentProcessor
 from src.vectordb import VectorDB
 from src.llm import InsuranceLLM
 
+# Set RAG_DEBUG=1 to dump retrieved chunks to rag_debug.log. Off by default:
+# formatting and printing full chunk contents stalls every query.
+DEBUG = os.environ.get("RAG_DEBUG") == "1"
+
+# Metadata fields actually read at query time - everything else is dropped
+# before insertion to keep Chroma's stored blobs small
+_KEEP_METADATA = ("source", "source_basename", "page", "content_type", "also_in")
+
+
+def _source_basename(doc: Document) -> str:
+    """
+    Get the source file basename for a document.
+
+    Uses the basename precomputed at ingestion when present; documents
+    loaded from an older database fall back to os.path.basename.
+    """
+    basename = doc.metadata.get("source_basename")
+    if basename is None:
+        basename = os.path.basename(doc.metadata.get("source", ""))
+    return basename
+
 
 class InsuranceRAG:
     """
@@ -24,7 +47,9 @@ class InsuranceRAG:
         pdf_directory: str = "data/pdfs",
         max_tokens: int = 450,
         token_overlap: int = 50,
-        persist_directory: str = "data/chroma_db"
+        persist_directory: str = "data/chroma_db",
+        embed_batch_size: int = 64,
+        parallelism: int = None
     ):
         """
         Initialize the RAG system.
@@ -34,15 +59,71 @@ class InsuranceRAG:
             max_tokens: Maximum tokens per chunk (default: 450)
             token_overlap: Token overlap between chunks (default: 50)
             persist_directory: Directory to persist the vector database
+            embed_batch_size: Number of chunks embedded per model call (default: 64)
+            parallelism: Number of worker processes for PDF ingestion;
+                1 forces sequential processing (default: auto - the
+                PDF_WORKERS env var, falling back to the CPU count)
         """
         self.pdf_directory = pdf_directory
+        self.max_tokens = max_tokens
+        self.token_overlap = token_overlap
+        self.parallelism = parallelism
         self.processor = DocumentProcessor(
             max_tokens=max_tokens,
             token_overlap=token_overlap
         )
-        self.vectordb = VectorDB(persist_directory=persist_directory)
+        self.vectordb = VectorDB(
+            persist_directory=persist_directory,
+            embed_batch_size=embed_batch_size,
+            preload=True  # Load models while the user types the first question
+        )
         self.llm = None  # Lazy loading
         self.documents: List[Document] = []
+        self._query_cache: List[tuple] = []  # (embedding, answer) pairs, LRU-bounded
+        self._exact_cache: dict = {}  # normalized question -> answer, cheapest cache layer
+        # Buffered debug log - avoids synchronous terminal writes per query
+        self._debug_log = open("rag_debug.log", "a", buffering=1 << 16) if DEBUG else None
+
+    # Queries closer than this cosine similarity reuse the cached answer
+    QUERY_CACHE_THRESHOLD = 0.97
+    QUERY_CACHE_MAX_SIZE = 256
+
+    def _check_query_cache(self, query_embedding: List[float]) -> str:
+        """
+        Look up a semantically equivalent previous query in the cache.
+
+        Embeddings are normalized, so cosine similarity is a plain dot
+        product. Returns the cached answer, or None on a miss.
+
+        Args:
+            query_embedding: Normalized embedding of the incoming question
+
+        Returns:
+            Cached answer string, or None
+        """
+        best_sim = -1.0
+        best_answer = None
+        for cached_embedding, answer in self._query_cache:
+            sim = sum(a * b for a, b in zip(query_embedding, cached_embedding))
+            if sim > best_sim:
+                best_sim = sim
+                best_answer = answer
+
+        if best_sim >= self.QUERY_CACHE_THRESHOLD:
+            return best_answer
+        return None
+
+    def _store_in_query_cache(self, query_embedding: List[float], answer: str):
+        """Store an answer in the query cache, evicting the oldest entry if full."""
+        self._query_cache.append((query_embedding, answer))
+        if len(self._query_cache) > self.QUERY_CACHE_MAX_SIZE:
+            self._query_cache.pop(0)
+
+    def _store_in_exact_cache(self, normalized_question: str, answer: str):
+        """Store an answer in the exact-match cache, evicting the oldest entry if full."""
+        self._exact_cache[normalized_question] = answer
+        if len(self._exact_cache) > self.QUERY_CACHE_MAX_SIZE:
+            self._exact_cache.pop(next(iter(self._exact_cache)))
 
     def load_documents(self) -> List[Document]:
         """
@@ -52,8 +133,22 @@ class InsuranceRAG:
             List of processed LangChain Document objects
         """
         print(f"Loading documents from {self.pdf_directory}...")
-        self.documents = self.processor.process_directory(self.pdf_directory)
-        
+
+        # Pooling lives in DocumentProcessor.process_files; an explicit
+        # worker count (including 1, for sequential runs) passes through
+        # unchanged, while None defers to PDF_WORKERS / CPU count there
+        self.documents = self.processor.process_directory(
+            self.pdf_directory, max_workers=self.parallelism
+        )
+
+        # Precompute source basenames once at ingestion so the query-time
+        # loops do a dict lookup instead of os.path.basename per document.
+        # sys.intern dedupes the repeated PDF names across chunks.
+        for doc in self.documents:
+            doc.metadata["source_basename"] = sys.intern(
+                os.path.basename(doc.metadata.get("source", ""))
+            )
+
         if self.documents:
             print(f"Loaded {len(self.documents)} chunks")
         
@@ -70,9 +165,21 @@ class InsuranceRAG:
             print("No documents to embed. Run load_documents() first.")
             return 0
 
+        # Deduplicate repeated boilerplate (headers, footers, TOC rows) by
+        # content hash - each unique chunk is embedded and stored once, with
+        # the other occurrences recorded in its metadata
+        unique_docs = self._deduplicate_documents(self.documents)
+        if len(unique_docs) < len(self.documents):
+            print(f"[*] Deduplicated {len(self.documents) - len(unique_docs)} "
+                  f"repeated chunks ({len(unique_docs)} unique)")
+
+        # Trim metadata to the whitelisted fields before insertion
+        for doc in unique_docs:
+            doc.metadata = {k: doc.metadata[k] for k in _KEEP_METADATA if k in doc.metadata}
+
         print(f"\n[*] Starting database creation...")
-        print(f"[*] Embedding {len(self.documents)} documents...")
-        count = self.vectordb.add_documents(self.documents)
+        print(f"[*] Embedding {len(unique_docs)} documents...")
+        count = self.vectordb.add_documents(unique_docs)
         print(f"[+] Database creation completed!")
         print(f"[+] Stored {count} documents in vector database")
         return count
@@ -89,51 +196,241 @@ class InsuranceRAG:
         Returns:
             Answer from the LLM
         """
-        # Initialize LLM if not already done (lazy loading)
-        if self.llm is None:
-            self.llm = InsuranceLLM()
-        
+        # Cheapest cache layer first: exact match on the normalized question
+        normalized = question.strip().lower()
+        cached_answer = self._exact_cache.get(normalized)
+        if cached_answer is not None:
+            if DEBUG:
+                print("[DEBUG] Exact cache hit - returning cached answer", file=self._debug_log)
+            return cached_answer
+
+        # Then the semantic cache - a hit skips both retrieval and the LLM
+        query_embedding = self.vectordb.embed_query(question)
+        cached_answer = self._check_query_cache(query_embedding)
+        if cached_answer is not None:
+            if DEBUG:
+                print("[DEBUG] Query cache hit - returning cached answer", file=self._debug_log)
+            return cached_answer
+
         # 1. Retrieve relevant documents
-        print(f"\n[DEBUG] Searching for: {question}")
-        documents = self.vectordb.search(question, k=k, use_reranker=True)
-        print(f"[DEBUG] Found {len(documents)} documents (after reranking)")
-        
-        if documents:
-            print("\n" + "="*80)
-            print("[DEBUG] FULL RETRIEVED CHUNKS:")
-            print("="*80)
-            for i, doc in enumerate(documents, 1):
-                source = os.path.basename(doc.metadata.get("source", "?"))
-                page = doc.metadata.get("page", "?")
-                content_type = doc.metadata.get("content_type", "?")
-                print(f"\n--- CHUNK {i} ---")
-                print(f"Source: {source}")
-                print(f"Page: {page}")
-                print(f"Type: {content_type}")
-                print(f"Content length: {len(doc.page_content)} chars")
-                print(f"Content:\n{doc.page_content}")
-                print("-" * 80)
-            print("="*80 + "\n")
-        
+        documents = self._retrieve(question, k)
+
         if not documents:
+            # No-match queries never touch the LLM
             return "No relevant documents found for this question."
-        
+
+        # Initialize LLM only once there is context to answer from
+        if self.llm is None:
+            self.llm = InsuranceLLM()
+
         # 2. Format context
         context = self.llm.format_context(documents)
-        
+
         # 3. Ask LLM
         answer = self.llm.ask(question, context)
-        
+
         # 4. Add sources if requested
         if show_sources:
-            answer += "\n\nSources:\n"
-            for i, doc in enumerate(documents, 1):
-                source = os.path.basename(doc.metadata.get("source", ""))
-                page = doc.metadata.get("page", "?")
-                answer += f"  {i}. {source} (page {page})\n"
-        
+            answer += self._format_sources(documents)
+
+        self._store_in_query_cache(query_embedding, answer)
+        self._store_in_exact_cache(normalized, answer)
         return answer
 
+    def query_stream(self, question: str, k: int = 5, show_sources: bool = False):
+        """
+        Streaming variant of query() - yields answer tokens as they arrive.
+
+        Args:
+            question: Question in Hebrew
+            k: Number of documents to retrieve for context
+            show_sources: Whether to append sources after the answer
+
+        Yields:
+            Answer tokens (and the sources block last, if requested)
+        """
+        # Cache hits yield the full stored answer at once
+        normalized = question.strip().lower()
+        cached_answer = self._exact_cache.get(normalized)
+        if cached_answer is not None:
+            if DEBUG:
+                print("[DEBUG] Exact cache hit - returning cached answer", file=self._debug_log)
+            yield cached_answer
+            return
+
+        query_embedding = self.vectordb.embed_query(question)
+        cached_answer = self._check_query_cache(query_embedding)
+        if cached_answer is not None:
+            if DEBUG:
+                print("[DEBUG] Query cache hit - returning cached answer", file=self._debug_log)
+            yield cached_answer
+            return
+
+        documents = self._retrieve(question, k)
+
+        if not documents:
+            yield "No relevant documents found for this question."
+            return
+
+        if self.llm is None:
+            self.llm = InsuranceLLM()
+
+        context = self.llm.format_context(documents)
+
+        answer_parts = []
+        for token in self.llm.ask_stream(question, context):
+            answer_parts.append(token)
+            yield token
+
+        answer = "".join(answer_parts)
+        if show_sources:
+            sources = self._format_sources(documents)
+            answer += sources
+            yield sources
+
+        self._store_in_query_cache(query_embedding, answer)
+        self._store_in_exact_cache(normalized, answer)
+
+    async def aquery(self, question: str, k: int = 5) -> str:
+        """
+        Async variant of query() for concurrent batch runs.
+
+        Retrieval runs in a thread (it is sync), the LLM call awaits the
+        OpenAI client, so N questions in flight serialize on neither.
+
+        Args:
+            question: Question in Hebrew
+            k: Number of documents to retrieve for context
+
+        Returns:
+            Answer from the LLM
+        """
+        loop = asyncio.get_running_loop()
+        documents = await loop.run_in_executor(None, self._retrieve, question, k)
+
+        if not documents:
+            return "No relevant documents found for this question."
+
+        if self.llm is None:
+            self.llm = InsuranceLLM()
+
+        context = self.llm.format_context(documents)
+        return await self.llm.aask(question, context)
+
+    def batch_query(self, questions: List[str], k: int = 5, concurrency: int = 8) -> List[str]:
+        """
+        Answer a batch of questions concurrently.
+
+        Fans the questions out with asyncio.gather so LLM calls overlap on
+        network latency, bounded by a semaphore.
+
+        Args:
+            questions: Questions in Hebrew
+            k: Number of documents to retrieve per question
+            concurrency: Maximum questions in flight at once
+
+        Returns:
+            Answers in the same order as the questions
+        """
+        async def _run():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def _one(question: str) -> str:
+                async with semaphore:
+                    return await self.aquery(question, k=k)
+
+            return await asyncio.gather(*(_one(q) for q in questions))
+
+        return list(asyncio.run(_run()))
+
+    @staticmethod
+    def _deduplicate_documents(documents: List[Document]) -> List[Document]:
+        """
+        Drop duplicate chunks, keeping the first occurrence of each content.
+
+        Other occurrences are merged into the survivor's metadata as an
+        "also_in" string of "source (page N)" entries, so attribution is
+        preserved without embedding the same text twice.
+
+        Args:
+            documents: Documents to deduplicate
+
+        Returns:
+            List of unique documents in original order
+        """
+        seen = {}
+        unique_docs = []
+        for doc in documents:
+            key = hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=16).digest()
+            if key in seen:
+                survivor = seen[key]
+                occurrence = (f"{doc.metadata.get('source_basename') or doc.metadata.get('source', '?')} "
+                              f"(page {doc.metadata.get('page', '?')})")
+                # Chroma metadata values must be scalars, so also_in is a
+                # "; "-joined string rather than a list
+                if survivor.metadata.get("also_in"):
+                    survivor.metadata["also_in"] += "; " + occurrence
+                else:
+                    survivor.metadata["also_in"] = occurrence
+            else:
+                seen[key] = doc
+                unique_docs.append(doc)
+
+        return unique_docs
+
+    def _format_sources(self, documents: List[Document]) -> str:
+        """Build the sources block appended to answers."""
+        sources = "\n\nSources:\n"
+        for i, doc in enumerate(documents, 1):
+            source = _source_basename(doc)
+            page = doc.metadata.get("page", "?")
+            sources += f"  {i}. {source} (page {page})\n"
+            # Duplicate chunks are stored once; list where else they appeared
+            also_in = doc.metadata.get("also_in")
+            if also_in:
+                sources += f"     also in: {also_in}\n"
+        return sources
+
+    def _retrieve(self, question: str, k: int) -> List[Document]:
+        """
+        Run hybrid search + reranking and dump the retrieved chunks for debugging.
+
+        Fetches a wide candidate pool and lets the reranker narrow it to k.
+
+        Args:
+            question: Question in Hebrew
+            k: Number of documents to return
+
+        Returns:
+            List of retrieved documents
+        """
+        fetch_k = max(4 * k, 40)
+        documents = self.vectordb.search(question, k=k, fetch_k=fetch_k, use_reranker=True)
+
+        if DEBUG:
+            log = self._debug_log
+            print(f"\n[DEBUG] Searching for: {question}", file=log)
+            print(f"[DEBUG] Retrieved {fetch_k} candidates, reranked to "
+                  f"{len(documents)}", file=log)
+            if documents:
+                print("\n" + "="*80, file=log)
+                print("[DEBUG] FULL RETRIEVED CHUNKS:", file=log)
+                print("="*80, file=log)
+                for i, doc in enumerate(documents, 1):
+                    source = _source_basename(doc)
+                    page = doc.metadata.get("page", "?")
+                    content_type = doc.metadata.get("content_type", "?")
+                    print(f"\n--- CHUNK {i} ---", file=log)
+                    print(f"Source: {source}", file=log)
+                    print(f"Page: {page}", file=log)
+                    print(f"Type: {content_type}", file=log)
+                    print(f"Content length: {len(doc.page_content)} chars", file=log)
+                    print(f"Content:\n{doc.page_content}", file=log)
+                    print("-" * 80, file=log)
+                print("="*80 + "\n", file=log)
+
+        return documents
+
     def get_stats(self) -> dict:
         """
         Get statistics about the loaded documents.
@@ -144,14 +441,24 @@ class InsuranceRAG:
         if not self.documents:
             return {"total_chunks": 0, "text_chunks": 0, "table_chunks": 0, "sources": 0}
 
-        text_chunks = sum(1 for doc in self.documents if doc.metadata.get("content_type") == "text")
-        table_chunks = sum(1 for doc in self.documents if doc.metadata.get("content_type") == "table")
-        
+        # Single pass over the documents instead of one scan per statistic
+        text_chunks = 0
+        table_chunks = 0
+        sources = set()
+        for doc in self.documents:
+            metadata = doc.metadata
+            content_type = metadata.get("content_type")
+            if content_type == "text":
+                text_chunks += 1
+            elif content_type == "table":
+                table_chunks += 1
+            sources.add(metadata.get("source", ""))
+
         return {
             "total_chunks": len(self.documents),
             "text_chunks": text_chunks,
             "table_chunks": table_chunks,
-            "sources": len(set(doc.metadata.get("source", "") for doc in self.documents))
+            "sources": len(sources)
         }
 
 
@@ -160,11 +467,20 @@ def main():
     Main execution function - demonstrates the RAG pipeline.
     
     Usage:
-        python rag.py           # Use existing DB if available
-        python rag.py --reset   # Clear and rebuild database
+        python rag.py               # Use existing DB if available
+        python rag.py --reset       # Clear and rebuild database
+        python rag.py --workers N   # Parallelize PDF ingestion across N processes
     """
-    rag = InsuranceRAG()
-    
+    # Check for workers flag (default: auto-detect in DocumentProcessor)
+    workers = None
+    if "--workers" in sys.argv:
+        try:
+            workers = int(sys.argv[sys.argv.index("--workers") + 1])
+        except (IndexError, ValueError):
+            print("Invalid --workers value, using auto-detection")
+
+    rag = InsuranceRAG(parallelism=workers)
+
     # Check for reset flag
     force_reset = "--reset" in sys.argv
     db_exists = rag.vectordb.exists()
@@ -193,41 +509,97 @@ def main():
         count = rag.vectordb.count()
         print(f"Database already exists with {count} documents")
         print(f"  Use 'python rag.py --reset' to rebuild")
-    
+
+    # Warm up the embedding model and LLM client now so the first chat turn
+    # doesn't pay the multi-second cold-start
+    print("\nWarming up models...")
+    try:
+        rag.vectordb.embeddings.embed_query("warmup")
+        if rag.llm is None:
+            rag.llm = InsuranceLLM()
+            rag.llm.llm.invoke([{"role": "user", "content": "ping"}])
+        print("Models ready")
+    except Exception as e:
+        print(f"Warmup skipped: {e}")
+
     # Demonstrate the RAG pipeline with example questions
     print("\n" + "="*60)
     print("RAG Pipeline Demo - Chat Interface")
     print("Ask questions about the insurance documents")
     print("To quit, type 'q', 'exit', or 'quit', or press Ctrl+C")
     print("="*60 + "\n")
-    
+
+    asyncio.run(chat_loop(rag))
+
+
+def _print_answer(rag: "InsuranceRAG", question: str):
+    """Stream one answer to the terminal (runs in a worker thread)."""
+    for token in rag.query_stream(question, k=5, show_sources=True):
+        print(token, end="", flush=True)
+    print()
+    print("-" * 60)
+
+
+async def chat_loop(rag: "InsuranceRAG"):
+    """
+    Async chat REPL.
+
+    With prompt_toolkit installed, the prompt stays responsive while the
+    previous answer is still streaming/flushing, so the user can type
+    question N+1 while reading answer N. Falls back to plain input() if
+    prompt_toolkit is unavailable.
+    """
+    try:
+        from prompt_toolkit import PromptSession
+        session = PromptSession()
+    except ImportError:
+        session = None
+
+    loop = asyncio.get_running_loop()
+    answer_task = None
+
     while True:
         try:
-            example_question = input("\nYour question: ").strip()
+            if session is not None:
+                question = await session.prompt_async("\nYour question: ")
+            else:
+                question = await loop.run_in_executor(None, input, "\nYour question: ")
+            question = question.strip()
+
             # Check for exit commands
-            if example_question.lower() in ['q', 'exit', 'quit']:
+            if question.lower() in ['q', 'exit', 'quit']:
                 print("\nGoodbye!")
                 break
-            
+
             # Skip empty input
-            if not example_question:
+            if not question:
                 print("Please ask a question")
                 continue
-            
-            print(f"\nQuestion: {example_question}")
-            print("-" * 60)
-            
-            answer = rag.query(example_question, k=5, show_sources=True)
-            print(answer)
+
+            # Let the previous answer finish printing before starting a new one
+            if answer_task is not None:
+                await answer_task
+
+            print(f"\nQuestion: {question}")
             print("-" * 60)
-            
+
+            # Stream the answer in a worker thread; the event loop (and the
+            # next prompt) stays free while tokens print
+            answer_task = loop.run_in_executor(None, _print_answer, rag, question)
+
         except KeyboardInterrupt:
             print("\n\nSession ended. Goodbye!")
             break
+        except EOFError:
+            print("\nGoodbye!")
+            break
         except Exception as e:
             print(f"Error: {e}")
             print("-" * 60)
 
+    if answer_task is not None:
+        await answer_task
+
 
 if __name__ == "__main__":
     main()
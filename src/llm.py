@@ -32,6 +32,26 @@ ANSWER FORMAT:
 - A detailed breakdown of relevant conditions and financial amounts (converted correctly from the Hebrew text)."""
 
 
+# User prompt templates, built once at import time
+PROMPT_TEMPLATE = """הקשר (Context):
+%s
+
+שאלת המשתמש:
+%s
+
+תשובה:"""
+
+NO_CONTEXT_PROMPT_TEMPLATE = """לא נמצא הקשר רלוונטי.
+
+שאלת המשתמש:
+%s
+
+תשובה:"""
+
+# Per-document context block, built once at import time
+CONTEXT_BLOCK_TEMPLATE = "[מקור %d: %s, עמוד %s, סוג: %s]\n%s\n"
+
+
 class InsuranceLLM:
     """
     LLM wrapper for insurance document Q&A.
@@ -61,6 +81,8 @@ class InsuranceLLM:
             temperature=temperature,
             api_key=api_key
         )
+        # System message is static - build it once instead of per ask() call
+        self._system_message = {"role": "system", "content": SYSTEM_PROMPT}
 
     def format_context(self, documents: List[Document]) -> str:
         """
@@ -75,18 +97,25 @@ class InsuranceLLM:
         if not documents:
             return ""
 
-        context_parts = []
-        
-        for i, doc in enumerate(documents, 1):
-            source = os.path.basename(doc.metadata.get("source", "Unknown Source"))
-            page = doc.metadata.get("page", "Unknown Page")
-            content_type = doc.metadata.get("content_type", "Unknown Content Type")
-            
-            context_parts.append(
-                f"[מקור {i}: {source}, עמוד {page}, סוג: {content_type}]\n"
-                f"{doc.page_content}\n"
+        # Preallocate and index-assign so the list never resizes
+        context_parts = [None] * len(documents)
+
+        for i, doc in enumerate(documents):
+            metadata = doc.metadata
+            # Basename is precomputed at ingestion; fall back for documents
+            # loaded from an older database
+            source = metadata.get("source_basename")
+            if source is None:
+                source = os.path.basename(metadata.get("source", "Unknown Source"))
+
+            context_parts[i] = CONTEXT_BLOCK_TEMPLATE % (
+                i + 1,
+                source,
+                metadata.get("page", "Unknown Page"),
+                metadata.get("content_type", "Unknown Content Type"),
+                doc.page_content
             )
-        
+
         return "\n---\n".join(context_parts)
 
     def build_prompt(self, context: str, question: str) -> str:
@@ -101,20 +130,9 @@ class InsuranceLLM:
             Complete user prompt
         """
         if not context:
-            return f"""לא נמצא הקשר רלוונטי.
+            return NO_CONTEXT_PROMPT_TEMPLATE % question
 
-שאלת המשתמש:
-{question}
-
-תשובה:"""
-
-        return f"""הקשר (Context):
-{context}
-
-שאלת המשתמש:
-{question}
-
-תשובה:"""
+        return PROMPT_TEMPLATE % (context, question)
 
     def ask(self, question: str, context: str) -> str:
         """
@@ -130,9 +148,9 @@ class InsuranceLLM:
         # Build user prompt
         user_prompt = self.build_prompt(context, question)
         
-        # Prepare messages
+        # Prepare messages (system message is prebuilt at init)
         messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
+            self._system_message,
             {"role": "user", "content": user_prompt}
         ]
         
@@ -140,5 +158,52 @@ class InsuranceLLM:
         print("[DEBUG] Sending request to LLM...")
         response = self.llm.invoke(messages)
         print("[DEBUG] Received response from LLM\n")
-        
+
         return response.content
+
+    async def aask(self, question: str, context: str) -> str:
+        """
+        Async variant of ask() for concurrent batch querying.
+
+        Args:
+            question: User's question in Hebrew
+            context: Formatted context from retrieved documents
+
+        Returns:
+            LLM's answer
+        """
+        user_prompt = self.build_prompt(context, question)
+
+        messages = [
+            self._system_message,
+            {"role": "user", "content": user_prompt}
+        ]
+
+        response = await self.llm.ainvoke(messages)
+        return response.content
+
+    def ask_stream(self, question: str, context: str):
+        """
+        Ask a question and stream the answer token by token.
+
+        Yields tokens as they arrive so callers can display partial output
+        instead of waiting for the full completion.
+
+        Args:
+            question: User's question in Hebrew
+            context: Formatted context from retrieved documents
+
+        Yields:
+            Answer tokens as strings
+        """
+        user_prompt = self.build_prompt(context, question)
+
+        messages = [
+            self._system_message,
+            {"role": "user", "content": user_prompt}
+        ]
+
+        print("[DEBUG] Streaming request to LLM...")
+        for chunk in self.llm.stream(messages):
+            if chunk.content:
+                yield chunk.content
@@ -6,11 +6,107 @@ Implements E5 embeddings with proper query/passage prefixes for optimal performa
 E5 models REQUIRE these prefixes for good retrieval quality.
 """
 
-from typing import List
+import functools
+import os
+from typing import List, Optional
 from langchain_core.embeddings import Embeddings
 from sentence_transformers import SentenceTransformer
 
 
+@functools.lru_cache(maxsize=4)
+def _load_model(model_name: str, device: str) -> SentenceTransformer:
+    """
+    Load a SentenceTransformer once per (model_name, device).
+
+    Model loading pulls ~500 MB of weights from disk, so repeated
+    E5Embeddings constructions share the same instance. On CUDA the model
+    runs in FP16 - embedding throughput roughly doubles with negligible
+    retrieval-quality impact.
+    """
+    model = SentenceTransformer(model_name, device=device)
+    # E5's real context window - avoids padding short chunks past 512
+    model.max_seq_length = 512
+    if "cuda" in device:
+        model.half()
+    return model
+
+
+def _default_device() -> str:
+    """Pick CUDA when available, otherwise CPU."""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class _ONNXEncoder:
+    """
+    Int8-quantized ONNX Runtime backend for E5 encoding.
+
+    Exports the model once (cached under data/onnx/), applies dynamic int8
+    quantization so ONNX Runtime can use VNNI int8 GEMM kernels on CPU, and
+    mirrors SentenceTransformer's mean-pool + L2-normalize pipeline.
+    Requires the optional `optimum[onnxruntime]` package.
+    """
+
+    MAX_LENGTH = 512
+
+    def __init__(self, model_name: str):
+        import numpy as np
+        import onnxruntime
+        from transformers import AutoTokenizer
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        self._np = np
+        cache_dir = os.path.join("data", "onnx", model_name.replace("/", "_"))
+        quantized_path = os.path.join(cache_dir, "model_quantized.onnx")
+
+        if not os.path.exists(quantized_path):
+            print("[*] Exporting and quantizing E5 to int8 ONNX (one time only)...")
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(cache_dir)
+            quantizer = ORTQuantizer.from_pretrained(cache_dir)
+            quantizer.quantize(
+                save_dir=cache_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False)
+            )
+            print("[+] Quantized model cached")
+
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.intra_op_num_threads = os.cpu_count()
+        self.session = onnxruntime.InferenceSession(quantized_path, sess_options)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=64, **_):
+        """Encode texts, mirroring SentenceTransformer.encode's output."""
+        np = self._np
+        single_input = isinstance(texts, str)
+        if single_input:
+            texts = [texts]
+
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            encoded = self.tokenizer(
+                batch, padding=True, truncation=True,
+                max_length=self.MAX_LENGTH, return_tensors="np"
+            )
+            hidden = self.session.run(
+                None,
+                {name: encoded[name] for name in ("input_ids", "attention_mask")}
+            )[0]
+
+            # Mean pooling over non-padding tokens
+            mask = encoded["attention_mask"][:, :, None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / mask.sum(axis=1).clip(min=1e-9)
+
+            if normalize_embeddings:
+                pooled = pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+            outputs.append(pooled)
+
+        result = np.concatenate(outputs, axis=0)
+        return result[0] if single_input else result
+
+
 class E5Embeddings(Embeddings):
     """
     Custom E5 embedding class using sentence-transformers.
@@ -25,23 +121,40 @@ class E5Embeddings(Embeddings):
     def __init__(
         self,
         model_name: str = "intfloat/multilingual-e5-base",
-        device: str = "cpu",
-        normalize_embeddings: bool = True
+        device: str = None,
+        normalize_embeddings: bool = True,
+        batch_size: int = 64,
+        backend: str = "torch"
     ):
         """
         Initialize E5 embeddings.
-        
+
         Args:
             model_name: HuggingFace model name
-            device: Device to run on ("cpu" or "cuda")
+            device: Device to run on ("cpu" or "cuda"; default: auto-detect)
             normalize_embeddings: Whether to normalize embeddings (recommended)
+            batch_size: Sentences encoded per forward pass (default: 64)
+            backend: "torch" (default) or "onnx-int8" for quantized ONNX
+                Runtime inference on CPU (needs optimum[onnxruntime])
         """
         self.model_name = model_name
-        self.device = device
+        self.device = device or _default_device()
+        device = self.device
         self.normalize_embeddings = normalize_embeddings
-        
+        self.batch_size = batch_size
+
         # Load the model
-        self.model = SentenceTransformer(model_name, device=device)
+        if backend == "onnx-int8":
+            try:
+                self.model = _ONNXEncoder(model_name)
+            except ImportError as e:
+                print(f"[!] ONNX backend unavailable ({e}), falling back to torch")
+                self.model = _load_model(model_name, device)
+        else:
+            self.model = _load_model(model_name, device)
+
+        # Token IDs of the "passage:" prefix, computed lazily on first use
+        self._passage_ids = None
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
@@ -56,18 +169,128 @@ class E5Embeddings(Embeddings):
         Returns:
             List of embeddings as lists of floats
         """
-        # Add "passage: " prefix for E5 models (REQUIRED for good retrieval)
+        if not texts:
+            return []
+
+        # Insurance PDFs repeat boilerplate (headers, footers, disclosures)
+        # across pages, so encode each distinct string once and scatter the
+        # vectors back into input order
+        unique_index = {}
+        order = []
+        unique_texts = []
+        for text in texts:
+            index = unique_index.get(text)
+            if index is None:
+                index = len(unique_texts)
+                unique_index[text] = index
+                unique_texts.append(text)
+            order.append(index)
+
+        vectors = self._embed_unique(unique_texts)
+        if len(unique_texts) == len(texts):
+            return vectors
+        return [vectors[index] for index in order]
+
+    def _embed_unique(self, texts: List[str]) -> List[List[float]]:
+        """Embed already-deduplicated passage texts."""
+        if isinstance(self.model, SentenceTransformer):
+            return self._encode_passages_token_prefix(texts)
+
+        # ONNX backend: prefix as strings - its encoder tokenizes internally
         prefixed_texts = [f"passage: {text}" for text in texts]
-        
         embeddings = self.model.encode(
             prefixed_texts,
-            convert_to_tensor=False,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
             normalize_embeddings=self.normalize_embeddings,
             show_progress_bar=False
         )
-        
         return embeddings.tolist()
+
+    def _encode_passages_token_prefix(self, texts: List[str]) -> List[List[float]]:
+        """
+        Encode passages with the "passage:" prefix prepended at token level.
+
+        Tokenizing the prefix once and concatenating its cached IDs after
+        [CLS] avoids allocating N prefixed strings and re-tokenizing the
+        same three tokens for every input. Batches are length-sorted like
+        SentenceTransformer.encode does, to minimize padding waste.
+        """
+        import torch
+
+        model = self.model
+        tokenizer = model.tokenizer
+        if self._passage_ids is None:
+            self._passage_ids = tokenizer.encode("passage:", add_special_tokens=False)
+        prefix_len = len(self._passage_ids)
+        device = model.device
+        prefix = torch.tensor([self._passage_ids], device=device)
+
+        # Longest-first so each batch pads to a similar length
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+
+        embeddings: List[Optional[torch.Tensor]] = [None] * len(texts)
+        with torch.no_grad():
+            for start in range(0, len(order), self.batch_size):
+                batch_indices = order[start:start + self.batch_size]
+                features = tokenizer(
+                    [texts[i] for i in batch_indices],
+                    padding=True, truncation=True,
+                    max_length=model.max_seq_length - prefix_len,
+                    return_tensors="pt"
+                )
+                features = {key: value.to(device) for key, value in features.items()}
+
+                # Splice the prefix in right after [CLS]; its tokens are all
+                # real, so the attention mask gets matching ones
+                input_ids = features["input_ids"]
+                rows = input_ids.shape[0]
+                features["input_ids"] = torch.cat(
+                    [input_ids[:, :1], prefix.expand(rows, -1), input_ids[:, 1:]], dim=1
+                )
+                mask = features["attention_mask"]
+                ones = torch.ones((rows, prefix_len), dtype=mask.dtype, device=device)
+                features["attention_mask"] = torch.cat(
+                    [mask[:, :1], ones, mask[:, 1:]], dim=1
+                )
+                if "token_type_ids" in features:
+                    types = features["token_type_ids"]
+                    features["token_type_ids"] = torch.cat(
+                        [types[:, :1], types[:, :1].expand(rows, prefix_len), types[:, 1:]],
+                        dim=1
+                    )
+
+                batch_embeddings = model(features)["sentence_embedding"]
+                if self.normalize_embeddings:
+                    batch_embeddings = torch.nn.functional.normalize(
+                        batch_embeddings, p=2, dim=1
+                    )
+                batch_embeddings = batch_embeddings.float().cpu()
+                for row, i in enumerate(batch_indices):
+                    embeddings[i] = batch_embeddings[row]
+
+        return [vector.tolist() for vector in embeddings]
     
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries with the "query: " prefix in one batched forward.
+
+        Args:
+            texts: Query texts to embed
+
+        Returns:
+            List of embeddings as lists of floats
+        """
+        prefixed_texts = [f"query: {text}" for text in texts]
+        embeddings = self.model.encode(
+            prefixed_texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize_embeddings,
+            show_progress_bar=False
+        )
+        return embeddings.tolist()
+
     def embed_query(self, text: str) -> List[float]:
         """
         Embed a single query with "query: " prefix.
@@ -10,6 +10,10 @@ Uses token-based chunking to ensure all content fits within the E5 model's
 
 import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 from typing import List, Union, Tuple
 from langchain_core.documents import Document
 
@@ -17,6 +21,42 @@ from .pdf_parser import PDFParser
 from .text_splitter import create_text_splitter
 from .tokenizer import E5Tokenizer
 
+# Markdown table patterns, compiled once at import. [ \t] instead of \s
+# keeps the classes from spanning newlines in full-text sweeps.
+# Separator row (|---|---|), possibly indented, at a line start
+_TABLE_SEP_LINE_RE = re.compile(r'(?m)^[ \t]*\|[ \t\-:]+\|')
+# A run of consecutive pipe-prefixed lines (one whole table)
+_TABLE_BLOCK_RE = re.compile(r'(?:[ \t]*\|[^\n]*(?:\n|\Z))+')
+# A single pipe-prefixed line start
+_PIPE_LINE_RE = re.compile(r'[ \t]*\|')
+
+
+def _iter_pdf_files(directory_path: str):
+    """
+    Yield paths of all PDFs under a directory, recursively.
+
+    Uses os.scandir so each entry's type comes from the cached DirEntry
+    instead of a separate stat call per file (os.walk pays one on some
+    platforms and network shares).
+    """
+    for entry in os.scandir(directory_path):
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_pdf_files(entry.path)
+        elif entry.name[-4:].lower() == '.pdf':
+            yield entry.path
+
+
+def _process_one_file(file_path: str, max_tokens: int, token_overlap: int) -> List[Document]:
+    """
+    Process a single PDF in a worker process.
+
+    Module-level so ProcessPoolExecutor can pickle it; each worker builds
+    its own DocumentProcessor since the parser and tokenizer are not
+    picklable.
+    """
+    processor = DocumentProcessor(max_tokens=max_tokens, token_overlap=token_overlap)
+    return processor.process_file(file_path)
+
 
 class DocumentProcessor:
     """
@@ -53,6 +93,10 @@ class DocumentProcessor:
             token_overlap=self.token_overlap
         )
 
+        # Warm the tokenizer in the background so its first-time load
+        # overlaps with PDF parsing instead of blocking the first split
+        threading.Thread(target=E5Tokenizer.get_instance, daemon=True).start()
+
     def _extract_tables(self, text: str) -> Tuple[str, List[str], List[int]]:
         """
         Extract Markdown tables from text and replace them with placeholders.
@@ -67,57 +111,61 @@ class DocumentProcessor:
         Returns:
             Tuple of (text_with_placeholders, list_of_tables, list_of_table_positions)
         """
+        # Fast exit for the common case: no pipes means no tables, and no
+        # separator rows means nothing to extract - both checks run at
+        # C level over the whole text
+        if '|' not in text:
+            return text, [], []
+
         tables = []
         table_positions = []  # Track where each table starts in the original text
-        lines = text.split('\n')
-        result_lines = []
-        i = 0
-        current_char_pos = 0
-        
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Check if this line starts a table (starts with | and next line is separator)
-            if line.startswith('|') and i + 1 < len(lines):
-                next_line = lines[i + 1].strip()
-                # Check if next line is a separator (contains dashes between pipes)
-                if re.match(r'^\|[\s\-:]+\|', next_line):
-                    # Found table start - save position
-                    table_start_pos = current_char_pos
-                    
-                    # Collect all table lines
-                    table_lines = []
-                    j = i
-                    while j < len(lines) and lines[j].strip().startswith('|'):
-                        table_lines.append(lines[j])
-                        j += 1
-                    
-                    # Save table, position, and add placeholder
-                    table_text = '\n'.join(table_lines)
-                    tables.append(table_text)
-                    table_positions.append(table_start_pos)
-                    result_lines.append(f'__TABLE_{len(tables) - 1}__')
-                    
-                    # Update character position
-                    for k in range(i, j):
-                        current_char_pos += len(lines[k]) + 1  # +1 for newline
-                    
-                    i = j
-                    continue
-            
-            result_lines.append(lines[i])
-            current_char_pos += len(lines[i]) + 1  # +1 for newline
-            i += 1
-        
-        return '\n'.join(result_lines), tables, table_positions
+        parts = []
+        cursor = 0  # End of the last consumed table span
+
+        # One C-level sweep finds every separator row; each one implies the
+        # line above it is a table header. This replaces the per-line Python
+        # state machine, whose bytecode dispatch dominated on documents that
+        # are mostly non-table lines.
+        for match in _TABLE_SEP_LINE_RE.finditer(text):
+            sep_start = match.start()
+            if sep_start < cursor or sep_start == 0:
+                continue  # Inside an already-collected table, or no header above
+
+            # The header row is the line right above the separator (the
+            # search stops before the separator's own leading newline), and
+            # it must itself be a pipe line
+            header_start = text.rfind('\n', 0, sep_start - 1) + 1
+            if header_start < cursor:
+                continue
+            if not _PIPE_LINE_RE.match(text, header_start):
+                continue
 
-    def _get_page_for_position(self, position: int, page_ranges: List[dict]) -> int:
-        """Find which page a character position belongs to."""
-        for page_info in page_ranges:
-            if page_info["start"] <= position < page_info["end"]:
-                return page_info["page"]
-        # Default to last page if position is beyond all ranges
-        return page_ranges[-1]["page"] if page_ranges else 1
+            # The table spans all consecutive pipe lines from the header on
+            block_end = _TABLE_BLOCK_RE.match(text, header_start).end()
+            if text[block_end - 1] == '\n':
+                block_end -= 1  # Trailing newline stays with the remainder
+
+            parts.append(text[cursor:header_start])
+            parts.append(f'__TABLE_{len(tables)}__')
+            tables.append(text[header_start:block_end])
+            table_positions.append(header_start)
+            cursor = block_end
+
+        if not tables:
+            return text, [], []
+
+        parts.append(text[cursor:])
+        return ''.join(parts), tables, table_positions
+
+    @staticmethod
+    def _pages_for_positions(positions: np.ndarray, page_starts: np.ndarray,
+                             page_nums: np.ndarray) -> np.ndarray:
+        """Map character positions to page numbers in one searchsorted call."""
+        if not len(page_starts):
+            return np.ones(len(positions), dtype=np.int32)
+        indices = np.searchsorted(page_starts, positions, side='right') - 1
+        # Positions past the last page clamp to it; before the first, to it
+        return page_nums[np.maximum(indices, 0)]
 
     def _chunk_table(self, table: str, max_tokens: int = None) -> List[str]:
         """
@@ -160,14 +208,14 @@ class DocumentProcessor:
             # Truncate the whole table as a fallback
             return [E5Tokenizer.truncate_to_tokens(table, max_tokens)]
         
-        # Split table by rows, keeping header in each chunk
+        # Split table by rows, keeping header in each chunk. Row lengths are
+        # counted in one batched tokenizer call so the loop is pure arithmetic
+        row_token_counts = E5Tokenizer.count_tokens_batch(data_rows)
         chunks = []
         current_rows = []
         current_tokens = header_tokens
-        
-        for row in data_rows:
-            row_tokens = E5Tokenizer.count_tokens(row)
-            
+
+        for row, row_tokens in zip(data_rows, row_token_counts):
             # If adding this row would exceed limit, save current chunk
             if current_tokens + row_tokens > max_tokens and current_rows:
                 chunk_content = header + '\n' + '\n'.join(current_rows)
@@ -198,33 +246,32 @@ class DocumentProcessor:
         Returns:
             List of LangChain Document objects
         """
-        # Parse PDF (parser accepts str)
-        pages = self.parser.parse_file(file_path)
+        # Stream pages straight into the parts list - the per-page dicts are
+        # never materialized as a full document list, keeping peak memory
+        # flat on long PDFs. Joined once; repeated += would be quadratic.
+        parts = []
+        page_nums = []
 
-        if not pages:
+        for page_data in self.parser.iter_pages(file_path):
+            parts.append(page_data["content"])
+            page_nums.append(page_data["metadata"].get("page", 1))
+
+        if not parts:
             return []
 
-        # Concatenate all pages and track page positions
-        full_text = ""
-        page_ranges = []  # Track where each page starts/ends
-        current_position = 0
-        
-        for page_data in pages:
-            page_content = page_data["content"]
-            page_num = page_data["metadata"].get("page", 1)
-            
-            page_ranges.append({
-                "page": page_num,
-                "start": current_position,
-                "end": current_position + len(page_content)
-            })
-            
-            full_text += page_content + "\n\n"
-            current_position += len(page_content) + 2  # +2 for \n\n
-        
-        full_text = full_text.strip()
-        source = pages[0]["metadata"].get("source", "")
-        total_pages = len(pages)
+        full_text = "\n\n".join(parts)
+        source = str(file_path)
+        total_pages = len(parts)
+
+        # SoA page table: page start offsets come from one cumulative sum
+        # over the part lengths (+2 per "\n\n" separator) instead of a
+        # Python running total, and all page lookups below collapse into
+        # single searchsorted calls
+        lengths = np.fromiter(
+            (len(part) + 2 for part in parts), dtype=np.int64, count=total_pages
+        )
+        page_starts = np.concatenate(([0], np.cumsum(lengths[:-1])))
+        page_nums = np.asarray(page_nums, dtype=np.int32)
         
         # Extract tables as separate chunks
         text_without_tables, tables, table_positions = self._extract_tables(full_text)
@@ -241,24 +288,43 @@ class DocumentProcessor:
         # Split only the text content
         split_docs = self.splitter.split_documents([text_doc])
         
-        # Add metadata to text chunks including page info
-        for chunk in split_docs:
-            chunk.metadata["content_type"] = "text"
-            
-            # Find chunk position in original text to determine page
-            # Use first 50 chars (or less) to find position
-            search_text = chunk.page_content[:50] if len(chunk.page_content) >= 50 else chunk.page_content
-            # Skip placeholder texts when searching
-            if not search_text.startswith("__TABLE_"):
-                chunk_start = full_text.find(search_text)
-                if chunk_start >= 0:
-                    chunk.metadata["page"] = self._get_page_for_position(chunk_start, page_ranges)
-        
+        # Add metadata to text chunks including page info. The splitter
+        # records each chunk's start_index, so no text searching is needed -
+        # only the mapping from placeholder-text positions back to original
+        # positions: every table replaced by a shorter placeholder shifts
+        # later positions left by the length difference, so add back the
+        # cumulative shift of all tables starting before the chunk.
+        if split_docs:
+            deltas = np.fromiter(
+                (len(table) - len(f'__TABLE_{k}__') for k, table in enumerate(tables)),
+                dtype=np.int64, count=len(tables)
+            )
+            shift_before = np.concatenate(([0], np.cumsum(deltas)))
+            placeholder_starts = (
+                np.asarray(table_positions, dtype=np.int64) - shift_before[:-1]
+            )
+
+            starts = np.fromiter(
+                (chunk.metadata.pop("start_index", 0) for chunk in split_docs),
+                dtype=np.int64, count=len(split_docs)
+            )
+            original_starts = starts + shift_before[
+                np.searchsorted(placeholder_starts, starts, side='left')
+            ]
+            chunk_pages = self._pages_for_positions(original_starts, page_starts, page_nums)
+            for chunk, page in zip(split_docs, chunk_pages):
+                chunk.metadata["content_type"] = "text"
+                chunk.metadata["page"] = int(page)
+
+        # Find which page each table starts on (one vectorized lookup)
+        table_pages = self._pages_for_positions(
+            np.asarray(table_positions, dtype=np.int64), page_starts, page_nums
+        )
+
         # Add tables as chunked documents with page info
-        for i, (table, table_start) in enumerate(zip(tables, table_positions)):
-            # Find which page this table starts on
-            page_num = self._get_page_for_position(table_start, page_ranges)
-            
+        for i, (table, page_num) in enumerate(zip(tables, table_pages)):
+            page_num = int(page_num)
+
             # Chunk the table if it's too large
             table_chunks = self._chunk_table(table)
             
@@ -279,16 +345,31 @@ class DocumentProcessor:
         
         return split_docs
 
-    def process_files(self, file_paths: List[Union[str]]) -> List[Document]:
+    # Below this many files the fork/spawn overhead outweighs the speedup
+    MIN_FILES_FOR_POOL = 4
+
+    def process_files(self, file_paths: List[Union[str]], max_workers: int = None) -> List[Document]:
         """
         Process a list of PDF files.
 
+        Parsing is CPU-bound and independent per file, so large batches are
+        fanned out across worker processes. Small batches stay in-process to
+        avoid pool startup overhead.
+
         Args:
             file_paths: List of paths to PDF files
+            max_workers: Worker processes to use (default: PDF_WORKERS env
+                var, falling back to the CPU count)
 
         Returns:
             List of LangChain Document objects from all PDFs
         """
+        if max_workers is None:
+            max_workers = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 1))
+
+        if max_workers > 1 and len(file_paths) >= self.MIN_FILES_FOR_POOL:
+            return self._process_files_parallel(file_paths, max_workers)
+
         all_documents = []
 
         for file_path in file_paths:
@@ -301,12 +382,37 @@ class DocumentProcessor:
 
         return all_documents
 
-    def process_directory(self, directory_path: Union[str]) -> List[Document]:
+    def _process_files_parallel(self, file_paths: List[Union[str]], max_workers: int) -> List[Document]:
+        """Fan PDF processing out across a process pool and merge the results."""
+        print(f"[*] Processing {len(file_paths)} PDFs with {max_workers} workers...")
+        all_documents = []
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(_process_one_file, file_path, self.max_tokens, self.token_overlap)
+                for file_path in file_paths
+            ]
+            # Collect in submission order so one bad PDF is reported and
+            # skipped without losing the rest of the batch - same contract
+            # as the sequential loop
+            for file_path, future in zip(file_paths, futures):
+                try:
+                    docs = future.result()
+                except Exception as e:
+                    print(f"[!] Error processing {file_path}: {e}")
+                    continue
+                all_documents.extend(docs)
+                print(f"[+] Processed: {os.path.basename(file_path)} ({len(docs)} chunks)")
+
+        return all_documents
+
+    def process_directory(self, directory_path: Union[str], max_workers: int = None) -> List[Document]:
         """
         Process all PDF files in a directory (including subdirectories).
 
         Args:
             directory_path: Path to the directory containing PDF files
+            max_workers: Worker processes to use (see process_files)
 
         Returns:
             List of LangChain Document objects from all PDFs
@@ -318,13 +424,9 @@ class DocumentProcessor:
             raise ValueError(f"Path is not a directory: {directory_path}")
 
         # Find all PDF files recursively
-        pdf_files = []
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                if file.endswith('.pdf'):
-                    pdf_files.append(os.path.join(root, file))
+        pdf_files = list(_iter_pdf_files(directory_path))
 
         if not pdf_files:
             return []
 
-        return self.process_files(pdf_files)
+        return self.process_files(pdf_files, max_workers=max_workers)
@@ -48,4 +48,5 @@ def create_text_splitter(
         separators=separators,
         length_function=E5Tokenizer.count_tokens,  # Token-based length!
         is_separator_regex=False,
+        add_start_index=True,  # Chunk offsets for page attribution
     )
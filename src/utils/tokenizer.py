@@ -6,10 +6,38 @@ Provides accurate token counting using the E5 model tokenizer.
 This ensures chunks fit within the embedding model's context window.
 """
 
-from typing import Optional
+import functools
+import os
+import threading
+
+from typing import List, Optional
 from transformers import AutoTokenizer
 
 
+@functools.lru_cache(maxsize=None)
+def _load_tokenizer(model_name: str) -> AutoTokenizer:
+    """Construct the HF tokenizer once per model name per process."""
+    print("[*] Loading E5 tokenizer...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    print("[+] E5 tokenizer loaded")
+    return tokenizer
+
+
+@functools.lru_cache(maxsize=100_000)
+def _count_tokens_cached(text: str) -> int:
+    """
+    Count tokens for a text, memoized by the raw string.
+
+    The recursive splitter re-evaluates the same substrings many times
+    while sizing chunks, so repeats resolve to a dict lookup instead of a
+    full tokenizer pass.
+    """
+    tokenizer = E5Tokenizer._instance
+    if tokenizer is None:
+        tokenizer = E5Tokenizer.get_instance()
+    return len(tokenizer.encode(text, add_special_tokens=True))
+
+
 class E5Tokenizer:
     """
     Singleton tokenizer for E5 model token counting.
@@ -19,16 +47,21 @@ class E5Tokenizer:
     """
     
     _instance: Optional[AutoTokenizer] = None
+    _lock = threading.Lock()
     MODEL_NAME = "intfloat/multilingual-e5-base"
     MAX_TOKENS = 512
-    
+
     @classmethod
     def get_instance(cls) -> AutoTokenizer:
-        """Get or create the tokenizer instance (lazy loading)."""
+        """Get or create the tokenizer instance (lazy loading, thread-safe)."""
+        # Double-checked locking: the load can be kicked off from a warm-up
+        # thread while the main thread is still parsing PDFs. lru_cache
+        # alone doesn't serialize the underlying call, so the lock keeps a
+        # race from constructing the tokenizer twice.
         if cls._instance is None:
-            print("[*] Loading E5 tokenizer...")
-            cls._instance = AutoTokenizer.from_pretrained(cls.MODEL_NAME)
-            print("[+] E5 tokenizer loaded")
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = _load_tokenizer(cls.MODEL_NAME)
         return cls._instance
     
     @classmethod
@@ -44,9 +77,36 @@ class E5Tokenizer:
         """
         if not text:
             return 0
-        tokenizer = cls.get_instance()
-        return len(tokenizer.encode(text, add_special_tokens=True))
-    
+        return _count_tokens_cached(text)
+
+    @classmethod
+    def count_tokens_batch(cls, texts: List[str]) -> List[int]:
+        """
+        Count tokens for many texts in one tokenizer call.
+
+        The fast tokenizer processes the whole batch on the Rust side, so
+        N counts cost one Python-to-Rust round trip instead of N.
+
+        Args:
+            texts: The texts to tokenize
+
+        Returns:
+            Token counts (including special tokens), one per input
+        """
+        if not texts:
+            return []
+        tokenizer = cls._instance
+        if tokenizer is None:
+            tokenizer = cls.get_instance()
+        encoded = tokenizer(texts, add_special_tokens=True, return_length=True)
+        return list(encoded["length"])
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Drop all memoized token counts."""
+        _count_tokens_cached.cache_clear()
+
+
     @classmethod
     def fits_context(cls, text: str, max_tokens: Optional[int] = None) -> bool:
         """
@@ -74,12 +134,35 @@ class E5Tokenizer:
         Returns:
             Truncated text that fits within the token limit
         """
-        tokenizer = cls.get_instance()
-        tokens = tokenizer.encode(text, add_special_tokens=True)
-        
-        if len(tokens) <= max_tokens:
+        tokenizer = cls._instance
+        if tokenizer is None:
+            tokenizer = cls.get_instance()
+
+        if not tokenizer.is_fast:
+            # Slow tokenizers have no offset mapping - decode the kept IDs
+            tokens = tokenizer.encode(text, add_special_tokens=True)
+            if len(tokens) <= max_tokens:
+                return text
+            return tokenizer.decode(tokens[:max_tokens], skip_special_tokens=True)
+
+        # Slice the original string at the last kept token's character
+        # offset instead of decoding - no per-token string allocations, and
+        # the result is a verbatim prefix of the input (decode can introduce
+        # spurious spaces in Hebrew, breaking downstream exact matching)
+        offsets = tokenizer(
+            text, return_offsets_mapping=True, add_special_tokens=True
+        )["offset_mapping"]
+
+        if len(offsets) <= max_tokens:
             return text
-        
-        # Truncate and decode
-        truncated_tokens = tokens[:max_tokens]
-        return tokenizer.decode(truncated_tokens, skip_special_tokens=True)
+
+        # Special tokens map to (0, 0), so the max end offset among the kept
+        # tokens marks the character boundary
+        cut = max(end for _, end in offsets[:max_tokens])
+        return text[:cut]
+
+
+# Opt-in: pay the tokenizer load at import time, in the background, so
+# freshly spawned pool workers have it ready before their first document
+if os.environ.get("HF_TOKENIZER_PREWARM") == "1":
+    threading.Thread(target=E5Tokenizer.get_instance, daemon=True).start()